@@ -10,10 +10,10 @@ import discord
 import os
 import gc
 from dotenv import load_dotenv
-import pandas as pd
 import matplotlib.pyplot as plt
 import datetime as dt
 import manipulation_plotting as mp
+import ingestion as ig
 
 
 # Run the bot
@@ -31,16 +31,16 @@ def main():
     # valid date
     try:
         url_us_reports = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data" \
-                         "/csse_covid_19_daily_reports_us/" + date + ".csv "
+                         "/csse_covid_19_daily_reports_us/" + date + ".csv"
         url_global_reports = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data" \
                              "/csse_covid_19_daily_reports/" + date + ".csv"
-        data = pd.read_csv(url_us_reports, error_bad_lines=False)
+        data = ig.load(url_us_reports, 'us_reports')
     except HTTPError:
         delta += 1
         date = dt.datetime.strptime(date, '%m-%d-%Y') - dt.timedelta(days=delta)  # Get yesterday's date for data access
         date = date.strftime('%m-%d-%Y')
         url_us_reports = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data" \
-                         "/csse_covid_19_daily_reports_us/" + date + ".csv "
+                         "/csse_covid_19_daily_reports_us/" + date + ".csv"
         url_global_reports = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data" \
                              "/csse_covid_19_daily_reports/" + date + ".csv"
     # US cases link
@@ -55,6 +55,11 @@ def main():
     url_recovered_ts = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data" \
                        "/csse_covid_19_time_series/time_series_covid19_recovered_global.csv"
 
+    # Local datasets, plotted when the request contains their key
+    # Quarantined_Students is a count of students in quarantine each day, not a cumulative count
+    ig.register_source("colby", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ColbyCovid.csv"),
+                       name_col="Group", place="Colby", exclude=["Quarantined_Students"])
+
     client = discord.Client()  # Begin the bot client
 
     @client.event
@@ -72,9 +77,7 @@ def main():
                 query_str = query_str.replace("united states", "the united states")
 
             # Parse request and plot
-            # if "colby" in query_str:
-            #     data = pd.read_csv("ColbyCovid.csv")
-            #
+            local = ig.match_local_source(query_str)
 
             if "report" in query_str:
                 auth = message.author
@@ -111,6 +114,23 @@ def main():
                         await message.author.send("You didn't enter anything.")
 
 
+            elif local is not None and ("total" in query_str or "daily" in query_str):
+                # Plot a registered local dataset, every group in it if none are named
+                try:
+                    data = ig.load_local(local)
+                except (OSError, ValueError):
+                    async with message.channel.typing():
+                        await message.channel.send("Sorry, the %s data could not be read." %
+                                                   ig.LOCAL_SOURCES[local]['place'])
+                    SENT = True
+                else:
+                    SENT = await mp.plot_request(data=data, colname=ig.LOCAL_SOURCES[local]['colname'],
+                                                 query_str=query_str, message=message,
+                                                 stat=ig.LOCAL_SOURCES[local]['stat'], default_all=True,
+                                                 place=ig.LOCAL_SOURCES[local]['place'], whole_names=True)
+                    del data
+                    gc.collect()
+
             elif "total" in query_str or "daily" in query_str:
                 if "us" in query_str:
                     colname = "Province_State"
@@ -124,67 +144,12 @@ def main():
                         stat = "cases"
 
                     # Read in data
-                    data = pd.read_csv(url, error_bad_lines=False)
-                    start_date, last_date, start_ind = mp.get_start_end_dates(
-                        data=data)  # First and last date containing case data
-
-                    state_names = list(data[colname])
-
-                    mp.data_clean(state_names)
-                    data[colname] = state_names
-
-                    states = []
-                    for i in range(0, len(state_names)):
-                        # Check for any matching state names from the message string
-                        if (state_names[i].title() in query_str.title()) and (state_names[i] not in states):
-                            states.append(state_names[i])
-
-                    fig, ax = plt.subplots()  # Set up plot
-                    states_summed = []  # Store summed states if multiple states are requested
-                    for i in range(0, len(states)):
-                        # Sum sub-region level data for the state
-                        state_sum = mp.get_loc_data(name=states[i], start_date=start_date,
-                                                    last_date=last_date, data=data, colname=colname)
-                        states_summed.append(state_sum)
-
-                        if "total" in query_str and len(states) == 1:
-                            # Only one state plot requested, plot and send message.
-                            mp.plot_total(data=data, location=state_sum, state=states[i],
-                                          start_date=start_date, last_date=last_date, ax=ax, stat=stat)
-                            mp.customize_plot(data=data, last_date=last_date,
-                                              start_date=start_date, ax=ax)
-                            await mp.send_total(data=data, location=state_sum, state=states[i],
-                                                start_date=start_date, message=message, stat=stat)
-                            SENT = True
-
-                        elif "daily" in query_str:
-                            # New plot for each region's daily results.
-                            fig, ax = plt.subplots()
-                            cases_ytdy, avg_ytdy, max_cases, max_ind = mp.plot_daily(data=data, location=state_sum,
-                                                                                     state=states[i],
-                                                                                     start_date=start_date,
-                                                                                     last_date=last_date,
-                                                                                     ax=ax, stat=stat)
-                            mp.customize_plot(data=data, last_date=last_date,
-                                              start_date=start_date, ax=ax)
-                            await mp.send_daily(data=data, state=states[i], cases=cases_ytdy,
-                                                avg=avg_ytdy, max_cases=max_cases, ind=max_ind,
-                                                message=message, stat=stat, start_ind=start_ind)
-                            SENT = True
-
-                    if "total" in query_str and len(states) > 1:
-                        # Different method call since multiple regions will be plotted on same plot
-                        mp.plot_totals(data=data, locations=states_summed, states=states,
-                                       start_date=start_date, last_date=last_date, ax=ax, stat=stat)
-                        mp.customize_plot(data=data, last_date=last_date,
-                                          start_date=start_date, ax=ax)
-                        await mp.send_totals(locations=states_summed, states=states,
-                                             message=message, stat=stat)
-                        SENT = True
+                    data = ig.load(url, 'us_time_series')
+                    SENT = await mp.plot_request(data=data, colname=colname, query_str=query_str,
+                                                 message=message, stat=stat)
 
                     # Remove data from memory
                     del data
-                    del states_summed
                     gc.collect()
 
                 if not SENT:
@@ -198,66 +163,12 @@ def main():
                         url = url_global_cases_ts
                         stat = "cases"
 
-                    data = pd.read_csv(url, error_bad_lines=False)
-                    start_date, last_date, start_ind = mp.get_start_end_dates(
-                        data=data)  # First and last date containing case data
-                    country_names = list(data[colname])
-
-                    mp.data_clean(country_names)
-                    data[colname] = country_names
-
-                    countries = []
-                    for i in range(0, len(country_names)):
-                        # Check for any matching state names from the message string
-                        if (country_names[i].title() in query_str.title()) and (country_names[i] not in countries):
-                            countries.append(country_names[i])
-
-                    fig, ax = plt.subplots()  # Set up plot
-                    countries_summed = []  # Store summed states if multiple states are requested
-                    for i in range(0, len(countries)):
-                        # Sum sub-region level data for the state
-                        state_sum = mp.get_loc_data(name=countries[i], start_date=start_date,
-                                                    last_date=last_date, data=data, colname=colname)
-                        countries_summed.append(state_sum)
-
-                        if "total" in query_str and len(countries) == 1:
-                            # Only one state plot requested, plot and send message.
-                            mp.plot_total(data=data, location=state_sum, state=countries[i],
-                                          start_date=start_date, last_date=last_date, ax=ax, stat=stat)
-                            mp.customize_plot(data=data, last_date=last_date,
-                                              start_date=start_date, ax=ax)
-                            await mp.send_total(data=data, location=state_sum, state=countries[i],
-                                                start_date=start_date, message=message, stat=stat)
-                            SENT = True
-
-                        elif "daily" in query_str:
-                            # New plot for each region's daily results.
-                            fig, ax = plt.subplots()
-                            cases_ytdy, avg_ytdy, max_cases, max_ind = mp.plot_daily(data=data, location=state_sum,
-                                                                                     state=countries[i],
-                                                                                     start_date=start_date,
-                                                                                     last_date=last_date,
-                                                                                     ax=ax, stat=stat)
-                            mp.customize_plot(data=data, last_date=last_date,
-                                              start_date=start_date, ax=ax)
-                            await mp.send_daily(data=data, state=countries[i], cases=cases_ytdy,
-                                                avg=avg_ytdy, max_cases=max_cases, ind=max_ind,
-                                                message=message, stat=stat, start_ind=start_ind)
-                            SENT = True
-
-                    if "total" in query_str and len(countries) > 1:
-                        # Different method call since multiple regions will be plotted on same plot
-                        mp.plot_totals(data=data, locations=countries_summed, states=countries,
-                                       start_date=start_date, last_date=last_date, ax=ax, stat=stat)
-                        mp.customize_plot(data=data, last_date=last_date,
-                                          start_date=start_date, ax=ax)
-                        await mp.send_totals(locations=countries_summed, states=countries,
-                                             message=message, stat=stat)
-                        SENT = True
+                    data = ig.load(url, 'global_time_series')
+                    SENT = await mp.plot_request(data=data, colname=colname, query_str=query_str,
+                                                 message=message, stat=stat)
 
                     # Remove data from memory
                     del data
-                    del countries_summed
                     gc.collect()
 
 
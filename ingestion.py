@@ -0,0 +1,231 @@
+# Author: Joseph Savage
+# Date: July 29, 2020
+# Schema-driven CSV loading for the JHU data and local datasets.
+
+import csv
+import datetime as dt
+import re
+import warnings
+from urllib.request import urlopen
+import pandas as pd
+
+# Use the multithreaded pyarrow parser when it is installed, otherwise pandas' C parser.
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    ENGINE = "pyarrow"
+    PYARROW_TYPES = {
+        'category': pa.dictionary(pa.int32(), pa.string()),
+        'int32': pa.int32(),
+        'float64': pa.float64()
+    }
+except ImportError:
+    ENGINE = "c"
+
+DATE_REGEX = re.compile('^\\d+/\\d+/\\d+$')
+
+# Malformed rows are handled the same way by both parsers, and as pandas did before:
+# rows with too many fields are skipped, rows with too few are kept with the missing
+# counts left empty.
+
+# Each schema declares the columns a request needs and the dtypes to parse them with.
+# "names" and "counts" map column names to dtypes. Wide schemas keep every date column
+# as a count of type "date_dtype"; "date_format" is the format of those column headers.
+SCHEMAS = {
+    'us_time_series': {
+        'names': {'Province_State': 'category'},
+        'wide': True,
+        'date_dtype': 'int32',
+        'date_format': '%m/%d/%y'
+    },
+    'global_time_series': {
+        'names': {'Country/Region': 'category'},
+        'wide': True,
+        'date_dtype': 'int32',
+        'date_format': '%m/%d/%y'
+    },
+    # Daily report counts have blanks, keep them as floats
+    'us_reports': {
+        'names': {'Province_State': 'category'},
+        'counts': {'Confirmed': 'float64', 'Deaths': 'float64', 'Recovered': 'float64',
+                   'Active': 'float64', 'Total_Test_Results': 'float64'}
+    },
+    'global_reports': {
+        'names': {'Country_Region': 'category'},
+        'counts': {'Confirmed': 'float64', 'Deaths': 'float64', 'Recovered': 'float64',
+                   'Active': 'float64'}
+    },
+    # Only the location names, for listing supported locations
+    'us_locations': {
+        'names': {'Province_State': 'category'},
+        'counts': {}
+    },
+    'global_locations': {
+        'names': {'Country/Region': 'category'},
+        'counts': {}
+    }
+}
+
+# Local wide-format datasets that can be plotted like the JHU time series, each with its own
+# schema. Requests containing the key are plotted from the registered file.
+LOCAL_SOURCES = {}
+
+
+def register_source(key, path, name_col, stat="cases", date_format='%m/%d/%Y', place=None, exclude=()):
+    """Registers a local wide-format CSV (one row per group, one column per date) as a plot source.
+    Every row must be a cumulative count, exclude lists groups that are not, such as a census.
+    The first column holds the group names and is renamed to name_col. place names the source
+    in plot titles and messages, the key is used if it is not given"""
+    LOCAL_SOURCES[key] = {
+        'path': path,
+        'colname': name_col,
+        'stat': stat,
+        'place': place if place is not None else key.title(),
+        'schema': {
+            'names': {name_col: 'category'},
+            'wide': True,
+            'date_format': date_format,
+            'fill_gaps': True,
+            'exclude': list(exclude)
+        }
+    }
+
+
+def match_local_source(query_str):
+    """Returns the key of the first registered local source named in the query, or None"""
+    for key in LOCAL_SOURCES:
+        if key in query_str:
+            return key
+    return None
+
+
+def load_local(key):
+    """Loads a registered local source"""
+    return read_source(LOCAL_SOURCES[key]['path'], LOCAL_SOURCES[key]['schema'])
+
+
+def load(path, schema_name):
+    """Reads a CSV from a URL or file path, keeping only the columns declared by the schema"""
+    return read_source(path, SCHEMAS[schema_name])
+
+
+def open_source(path):
+    """Opens a URL or file path as a binary stream"""
+    if "://" in path:
+        return urlopen(path)
+    return open(path, "rb")
+
+
+def read_source(path, schema):
+    """Streams a CSV from a URL or file path and parses it with the given schema"""
+    try:
+        return parse_source(path, schema, ENGINE)
+    except ValueError:
+        # pyarrow can't keep rows with missing fields and the C parser expects time series
+        # counts to be integers, so read the file again with the C parser allowing gaps
+        return parse_source(path, schema, "c", gaps=True)
+
+
+def parse_source(path, schema, engine, gaps=False):
+    """Parses a CSV from a URL or file path with the given schema and parser"""
+    with open_source(path) as source:
+        # The header is read first so date columns can be found, the parser gets the rest
+        header = next(csv.reader([source.readline().decode("utf-8-sig")]))
+        name_col = list(schema['names'])[0]
+        if not schema.get('wide', False):
+            return read_csv(source, header, dict(schema['names'], **schema['counts']), engine=engine)
+
+        if schema.get('fill_gaps', False):
+            header[0] = name_col
+        dates = [col for col in header if DATE_REGEX.match(col)]
+
+        if schema.get('fill_gaps', False):
+            # Local files are small but have blanks, "NA" and notes in the count cells,
+            # so read them as text
+            data = pd.read_csv(source, header=None, names=header, dtype=str,
+                               on_bad_lines="skip")[[name_col] + dates]
+            data = data[~data[name_col].isin(schema['exclude'])]
+            data = fill_gaps(data, name_col, dates)
+            data[name_col] = data[name_col].astype(schema['names'][name_col])
+        else:
+            date_dtype = 'float64' if gaps else schema['date_dtype']
+            data = read_csv(source, header, schema['names'], dates, date_dtype, engine=engine, gaps=gaps)
+
+    # Plotting expects the name column first, then dates in the JHU m/d/yy format
+    data = data[[name_col] + [col for col in data.columns if col != name_col]]
+    if schema['date_format'] != '%m/%d/%y':
+        data.columns = [name_col] + [normalize_date(col, schema['date_format']) for col in data.columns[1:]]
+    return data
+
+
+def read_csv(source, header, dtypes, dates=(), date_dtype=None, engine=ENGINE, gaps=False):
+    """Parses the dtypes columns and any date columns of a CSV stream positioned after its header.
+    Raises ValueError if pyarrow finds a row with missing fields, or, unless gaps is set,
+    if the C parser finds a date without a count"""
+    usecols = list(dtypes) + list(dates)
+    if engine == "pyarrow":
+        short_rows = []
+
+        def skip_row(row):
+            if row.actual_columns < row.expected_columns:
+                short_rows.append(row.number)
+            return "skip"
+
+        # pandas' pyarrow engine casts column by column after parsing, so call pyarrow directly
+        column_types = {col: PYARROW_TYPES[dtype] for col, dtype in dtypes.items()}
+        column_types.update({date: PYARROW_TYPES[date_dtype] for date in dates})
+        table = pa_csv.read_csv(
+            source,
+            read_options=pa_csv.ReadOptions(column_names=header),
+            parse_options=pa_csv.ParseOptions(invalid_row_handler=skip_row),
+            convert_options=pa_csv.ConvertOptions(include_columns=usecols, column_types=column_types))
+        if short_rows:
+            raise ValueError("Rows with missing fields")
+        return table.to_pandas(self_destruct=True)
+
+    # pandas only skips rows with too many fields when every column is parsed, so columns
+    # outside the schema are read as text and dropped afterwards
+    if not dates:
+        data = pd.read_csv(source, header=None, names=header, on_bad_lines="skip",
+                           dtype={col: dtypes.get(col, str) for col in header})
+        return data[usecols]
+
+    # The C parser is slow to cast columns one by one and to check each count for NA values,
+    # so every date is parsed with a single dtype and, unless there are gaps, no NA checks.
+    # The other columns are read as text by converters, which pandas warns override the
+    # dtype, and the name columns are converted afterwards.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", pd.errors.ParserWarning)
+        data = pd.read_csv(source, header=None, names=header, dtype=date_dtype,
+                           converters={col: str for col in header if col not in dates},
+                           na_filter=gaps, on_bad_lines="skip")
+    data = data[usecols]
+    for col, dtype in dtypes.items():
+        data[col] = data[col].astype(dtype)
+    return data
+
+
+def fill_gaps(data, name_col, dates):
+    """Drops rows without a name or without any counts, and trailing empty dates. Gaps between
+    two observations carry the last count over, unless the count was reset after the gap.
+    Other gaps, including those after a group's last observation, are left empty"""
+    data = data.dropna(subset=[name_col])
+    counts = data[dates].apply(pd.to_numeric, errors="coerce")
+    observed = counts.notna().any(axis=1)
+    data = data[observed].reset_index(drop=True)
+    counts = counts[observed].reset_index(drop=True)
+    filled = counts.notna().any(axis=0)
+    if not filled.any():
+        raise ValueError("No counts found in the dataset")
+    counts = counts.loc[:, :filled[filled].index[-1]]
+
+    before = counts.ffill(axis=1)
+    after = counts.bfill(axis=1)
+    counts = counts.fillna(before.where(after >= before))
+    return pd.concat([data[[name_col]], counts], axis=1)
+
+
+def normalize_date(date, date_format):
+    """Converts a date column header to the m/d/yy format used by the JHU data"""
+    date = dt.datetime.strptime(date, date_format)
+    return "%d/%d/%s" % (date.month, date.day, date.strftime('%y'))
@@ -3,19 +3,20 @@
 # Mini-library of functions for plotting and message sending.
 
 import datetime as dt
+import re
 from textwrap import wrap
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import discord
 import asyncio
+import ingestion as ig
 
 
 def get_start_end_dates(data):
     """Finds the first and last dates of available data in mm/dd/yy format"""
     start_date = data.filter(regex='\\d+/\\d+/\\d\\d', axis="columns").columns[0]
-    last_date = dt.datetime.strptime(data.columns[-1], '%m/%d/%y').strftime(
-        '%m/%#d/%y').lstrip("0").replace(" 0", " ")
+    last_date = data.columns[-1]  # Already m/d/yy, reformatting it with %#d only works on Windows
     start_ind = data.columns.get_loc(start_date)
     return start_date, last_date, start_ind
 
@@ -24,22 +25,22 @@ def get_loc_data(name, start_date, last_date, data, colname):
     """Finds province/state location data and sums columns for that location,
     returning an array of length start_date:last_date"""
     loc_rows = data.index[data[colname] == name].tolist()
-    loc_sum = data.loc[loc_rows, start_date:last_date].sum(axis=0)
+    loc_sum = data.loc[loc_rows, start_date:last_date].sum(axis=0, min_count=1)
     return loc_sum
 
 
-def plot_total(data, location, state, start_date, last_date, ax, stat):
+def plot_total(data, location, state, start_date, last_date, ax, stat, place="US"):
     """Plots total cases for a single region"""
     ax.plot(data.columns[data.columns.get_loc(start_date):(data.columns.get_loc(last_date) + 1)],
             location,
             color="red")
-    title = "Total Reported COVID-19 %s for %s \nsince the first US case" % (stat, state.title())
+    title = "Total Reported COVID-19 %s for %s \nsince the first %s case" % (stat, state.title(), place)
     ax.set(title=title.title(),
            xlabel="Date",
            ylabel="Total %s" % stat.title())
 
 
-def plot_totals(data, locations, states, start_date, last_date, ax, stat):
+def plot_totals(data, locations, states, start_date, last_date, ax, stat, place="US"):
     """Plots total cases for multiple regions"""
     evenly_spaced_interval = np.linspace(0, 1, len(states))  # For color map
     colors = [plt.cm.get_cmap("tab20")(x) for x in evenly_spaced_interval]
@@ -52,17 +53,19 @@ def plot_totals(data, locations, states, start_date, last_date, ax, stat):
     for i in range(0, len(states) - 1):
         states_names += states[i] + ", "
     states_names += "and " + states[-1]
-    title = "Total Reported Covid %s for %s since the first US case" % (stat, states_names)
+    title = "Total Reported Covid %s for %s since the first %s case" % (stat, states_names, place)
     ax.set(title="\n".join(wrap(title.title(), 60)),
            xlabel="Date",
            ylabel="Total %s" % stat.title())
     plt.legend()
 
 
-def plot_daily(data, location, state, start_date, last_date, ax, stat):
+def plot_daily(data, location, state, start_date, last_date, ax, stat, place="US"):
     """Plots daily cases for a region"""
-    daily = np.array(location)  # numpy.append(0, state_sum)
-    daily = np.append(location[0], np.subtract(daily[1:(len(location))], daily[0:(len(location) - 1)]))
+    daily = np.array(location)
+    # The first count may be a starting balance rather than that day's cases, so start at 0
+    daily = np.append(0, np.subtract(daily[1:(len(location))], daily[0:(len(location) - 1)]))
+    daily = np.nan_to_num(daily).astype(np.int64)  # Days next to a gap in local data count as no new cases
     ax.bar(data.columns[data.columns.get_loc(start_date):(data.columns.get_loc(last_date) + 1)],
            daily,
            color="darkgreen",
@@ -81,7 +84,7 @@ def plot_daily(data, location, state, start_date, last_date, ax, stat):
     ax.plot(data.columns[data.columns.get_loc(start_date):(data.columns.get_loc(last_date) + 1)],
             rolling_avg,
             color="red")
-    title = "Daily Reported Covid %s for %s \nsince the first US case" % (stat, state.title())
+    title = "Daily Reported Covid %s for %s \nsince the first %s case" % (stat, state.title(), place)
     ax.set(title=title.title(),
            xlabel="Date",
            ylabel="Number of %s" % stat)
@@ -94,21 +97,23 @@ def customize_plot(data, last_date, start_date, ax):
     plt.setp(ax.get_xticklabels(), rotation=45)
     start = 0
     end = data.columns.get_loc(last_date) - data.columns.get_loc(start_date)
-    trash_idxs = data.columns.size - end - 1
-    date_labels = data.filter(regex='\\d+/1/\\d\\d', axis="columns").columns
+    trash_idxs = data.columns.get_loc(start_date)
+    date_labels = data.loc[:, start_date:last_date].filter(regex='\\d+/1/\\d\\d', axis="columns").columns
 
     date_labels = np.insert(date_labels, 0, start_date)
     date_labels = np.append(date_labels, last_date)
+    date_labels = list(dict.fromkeys(date_labels))  # The start or last date can be the 1st of a month
 
     date_idxs = np.where(np.isin(np.array(data.columns), np.array(date_labels)) == True)[0] - trash_idxs
     date_labels = [
         dt.datetime.strptime(date, '%m/%d/%y').strftime('%b %d, %y').lstrip("0").replace(" 0", " ")
         for date in date_labels]
 
-    if date_idxs[1] < 14:
+    # Drop labels too close to the first and last dates, unless they are the only ones
+    if len(date_idxs) > 2 and date_idxs[1] < 14:
         date_labels = np.delete(date_labels, 1)
         date_idxs = np.delete(date_idxs, 1)
-    if (date_idxs[-1] - date_idxs[-2] < 14):
+    if len(date_idxs) > 2 and (date_idxs[-1] - date_idxs[-2] < 14):
         date_labels = np.delete(date_labels, -2)
         date_idxs = np.delete(date_idxs, -2)
 
@@ -141,23 +146,25 @@ async def send_total(data, location, state, start_date, message, stat):
     async with message.channel.typing():
         await message.channel.send("%s has reached %s %s since the first recorded %s there on %s."
                                    % (state.title(),
-                                      f"{location[-1]:,d}",
+                                      f"{int(location.iloc[-1]):,d}",
                                       stat,
                                       stat[:len(stat) - 1],
                                       first_date),
                                    file=discord.File("covid_plot.png"))
 
 
-async def send_totals(locations, states, message, stat):
+async def send_totals(locations, states, message, stat, place="US"):
     """Sends message with plot of total cases for multiple regions"""
-    response = """Since the first recorded %s in the United States: \n""" % stat[:len(stat) - 1]
-    for i in range(0, len(states) - 1):
-        response += "%s has reached %s %s\n" % (states[i],
-                                                f"{locations[i][-1]:,d}",
-                                                stat.title())
-    response += "%s has reached %s %s\n" % (states[-1],
-                                            f"{locations[-1][-1]:,d}",
-                                            stat.title())
+    response = """Since the first recorded %s %s: \n""" % (place, stat[:len(stat) - 1])
+    for i in range(0, len(states)):
+        reached = locations[i].dropna()  # Local datasets can stop reporting a region early
+        response += "%s has reached %s %s" % (states[i],
+                                             f"{int(reached.iloc[-1]):,d}",
+                                             stat.title())
+        if reached.index[-1] != locations[i].index[-1]:
+            response += " as of %s" % dt.datetime.strptime(reached.index[-1], '%m/%d/%y').strftime(
+                '%b %d, %Y').lstrip("0").replace(" 0", " ")
+        response += "\n"
     async with message.channel.typing():
         await message.channel.send(response,
                                    file=discord.File("covid_plot.png"))
@@ -181,6 +188,89 @@ async def send_daily(data, state, cases, avg, max_cases, ind, message, stat, sta
             file=discord.File("covid_plot.png"))
 
 
+async def plot_request(data, colname, query_str, message, stat, default_all=False, place="US",
+                       whole_names=False):
+    """Plots and sends total or daily data for every location in data named in the query.
+    If default_all is set and no location is named, every location is plotted. If whole_names
+    is set, a location only matches a whole word or name in the query. place names the data's
+    source in titles and messages. Returns True if a plot was sent"""
+    SENT = False
+    start_date, last_date, start_ind = get_start_end_dates(
+        data=data)  # First and last date containing case data
+
+    names = list(data[colname])
+
+    data_clean(names)
+    data[colname] = pd.Categorical(names)
+
+    locs = []
+    for i in range(0, len(names)):
+        # Check for any matching location names from the message string
+        if whole_names:
+            # "Students" should not match "Quarantined_Students"
+            found = re.search("(?<![\\w/])%s(?![\\w/])" % re.escape(names[i].lower()), query_str.lower())
+        else:
+            found = names[i].title() in query_str.title()
+        if found and (names[i] not in locs):
+            locs.append(names[i])
+    if default_all and len(locs) == 0:
+        locs = list(dict.fromkeys(names))
+
+    locs_summed = []  # Store summed locations if multiple locations are requested
+    for loc in list(locs):
+        # Sum sub-region level data for the location, skipping locations without any counts
+        loc_sum = get_loc_data(name=loc, start_date=start_date,
+                               last_date=last_date, data=data, colname=colname)
+        if loc_sum.first_valid_index() is None:
+            locs.remove(loc)
+        else:
+            locs_summed.append(loc_sum)
+
+    fig, ax = plt.subplots()  # Set up plot
+    for i in range(0, len(locs)):
+        # Local datasets can have gaps at either end, plot only the dates the location has data for
+        loc_sum = locs_summed[i][locs_summed[i].first_valid_index():locs_summed[i].last_valid_index()]
+        loc_start, loc_last = loc_sum.index[0], loc_sum.index[-1]
+
+        if "total" in query_str and len(locs) == 1:
+            # Only one location plot requested, plot and send message.
+            plot_total(data=data, location=loc_sum, state=locs[i],
+                       start_date=loc_start, last_date=loc_last, ax=ax, stat=stat, place=place)
+            customize_plot(data=data, last_date=loc_last,
+                           start_date=loc_start, ax=ax)
+            await send_total(data=data, location=loc_sum, state=locs[i],
+                             start_date=loc_start, message=message, stat=stat)
+            SENT = True
+
+        elif "daily" in query_str:
+            # New plot for each region's daily results.
+            fig, ax = plt.subplots()
+            cases_ytdy, avg_ytdy, max_cases, max_ind = plot_daily(data=data, location=loc_sum,
+                                                                  state=locs[i],
+                                                                  start_date=loc_start,
+                                                                  last_date=loc_last,
+                                                                  ax=ax, stat=stat, place=place)
+            customize_plot(data=data, last_date=loc_last,
+                           start_date=loc_start, ax=ax)
+            await send_daily(data=data, state=locs[i], cases=cases_ytdy,
+                             avg=avg_ytdy, max_cases=max_cases, ind=max_ind,
+                             message=message, stat=stat, start_ind=data.columns.get_loc(loc_start))
+            SENT = True
+
+    if "total" in query_str and len(locs) > 1:
+        # Different method call since multiple regions will be plotted on same plot
+        plot_totals(data=data, locations=locs_summed, states=locs,
+                    start_date=start_date, last_date=last_date, ax=ax, stat=stat, place=place)
+        customize_plot(data=data, last_date=last_date,
+                       start_date=start_date, ax=ax)
+        await send_totals(locations=locs_summed, states=locs,
+                          message=message, stat=stat, place=place)
+        SENT = True
+
+    del locs_summed
+    return SENT
+
+
 async def report(message, url, glob, client):
     """Sends a report of the top worst states by cases and deaths"""
     reactions = np.array(['\u0031\u20E3', '\u0032\u20E3', '\u0033\u20E3', '\u0034\u20E3', '\u0035\u20E3', '\u0036\u20E3'])
@@ -223,9 +313,9 @@ async def report(message, url, glob, client):
             reaction, user = await client.wait_for('reaction_add', timeout=60, check=lambda r, u: u == auth and
                                                                                                   r.message.id == msg.id and r.emoji in reactions)
             stat_column = stats_dict[reaction.emoji]
-            data = pd.read_csv(url, error_bad_lines=False)
+            data = ig.load(url, 'global_reports')
 
-            data = data.groupby('Country_Region')[['Confirmed','Deaths', 'Recovered','Active']].sum().reset_index()
+            data = data.groupby('Country_Region', observed=True)[['Confirmed','Deaths', 'Recovered','Active']].sum().reset_index()
             case_fatality = data["Deaths"]/data['Confirmed']
             data['Case/Fatality Ratio'] = case_fatality
             stats = data.nlargest(n=5, columns=stat_column)
@@ -270,9 +360,9 @@ async def report(message, url, glob, client):
             reaction, user = await client.wait_for('reaction_add', timeout=60, check=lambda r, u: u == auth and
                                                                                                   r.message.id == msg.id and r.emoji in reactions)
             stat_column = stats_dict[reaction.emoji]
-            data = pd.read_csv(url, error_bad_lines=False)
+            data = ig.load(url, 'us_reports')
 
-            data = data.groupby('Province_State')[['Confirmed', 'Deaths', 'Recovered', 'Active', 'Total_Test_Results']].sum().reset_index()
+            data = data.groupby('Province_State', observed=True)[['Confirmed', 'Deaths', 'Recovered', 'Active', 'Total_Test_Results']].sum().reset_index()
             case_fatality = data["Deaths"] / data['Confirmed']
             data['Case/Fatality Ratio'] = case_fatality
             stats = data.nlargest(n=5, columns=stat_column)
@@ -335,15 +425,15 @@ async def request_locs(message):
     if "countries" in message.content.lower():
         url = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data" \
               "/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv"
-        data = pd.read_csv(url, error_bad_lines=False)
-        locs = np.sort(pd.unique(data["Country/Region"]))
+        data = ig.load(url, 'global_locations')
+        locs = np.sort(np.array(data["Country/Region"].cat.categories))
         del data
         msg_title = "Supported Countries/Regions"
     elif "states" in message.content.lower():
         url = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data" \
               "/csse_covid_19_time_series/time_series_covid19_confirmed_US.csv"
-        data = pd.read_csv(url, error_bad_lines=False)
-        locs = np.sort(pd.unique(data["Province_State"]))
+        data = ig.load(url, 'us_locations')
+        locs = np.sort(np.array(data["Province_State"].cat.categories))
         del data
         msg_title = "Supported States/Territories"
     else: